@@ -0,0 +1,327 @@
+import sys
+import json
+import math
+import argparse
+import numpy as np
+import pandas as pd
+
+# Codici di uscita del gate
+EXIT_OK = 0
+EXIT_REGRESSIONE = 1
+EXIT_ERRORE = 2
+
+# Valori usati se non indicati né da riga di comando né da una baseline salvata
+COLONNA_DEFAULT = 'gpu_power_watts'
+SEGMENTI_DEFAULT = 10
+
+
+def carica_run(path, colonna_potenza=COLONNA_DEFAULT):
+    """Carica da un CSV del monitor solo le colonne necessarie al confronto"""
+    header = pd.read_csv(path, nrows=0).columns
+    if 'elapsed_time' not in header or colonna_potenza not in header:
+        raise ValueError(f"{path}: colonne 'elapsed_time' o '{colonna_potenza}' mancanti")
+
+    usecols = ['elapsed_time', colonna_potenza]
+    if 'phase' in header:
+        usecols.append('phase')
+
+    df = pd.read_csv(path, usecols=usecols, dtype={'phase': str} if 'phase' in header else None)
+    df = df.dropna(subset=['elapsed_time', colonna_potenza])
+    if len(df) < 2:
+        raise ValueError(f"{path}: servono almeno 2 campioni con potenza valida")
+
+    fasi = None
+    if 'phase' in df.columns and df['phase'].notna().any():
+        fasi = df['phase'].fillna('').to_numpy()
+
+    return {
+        'path': path,
+        't': df['elapsed_time'].to_numpy(dtype=np.float64),
+        'p': df[colonna_potenza].to_numpy(dtype=np.float64),
+        'fasi': fasi
+    }
+
+
+def energia_intervalli(t, p):
+    """Energia (J) di ogni intervallo tra campioni consecutivi, regola dei trapezi"""
+    return 0.5 * (p[1:] + p[:-1]) * np.diff(t)
+
+
+def statistiche_run(run):
+    """Energia totale, potenza media e p95, durata di un singolo run"""
+    t, p = run['t'], run['p']
+    energia_j = energia_intervalli(t, p).sum()
+    durata = t[-1] - t[0]
+    return {
+        'energy_wh': energia_j / 3600,
+        'mean_power_w': energia_j / durata if durata > 0 else float(p.mean()),
+        'p95_power_w': float(np.percentile(p, 95)),
+        'duration_s': float(durata)
+    }
+
+
+def segmenti_progresso(run, n_segmenti):
+    """Energia (Wh) per segmento di avanzamento normalizzato nel tempo (0..1)"""
+    t, p = run['t'], run['p']
+    durata = t[-1] - t[0]
+    progresso = (t[:-1] - t[0]) / durata if durata > 0 else np.zeros(len(t) - 1)
+    indici = np.minimum((progresso * n_segmenti).astype(np.int64), n_segmenti - 1)
+    energie = np.bincount(indici, weights=energia_intervalli(t, p), minlength=n_segmenti) / 3600
+    return {f"{100 * i // n_segmenti}-{100 * (i + 1) // n_segmenti}%": float(e) for i, e in enumerate(energie)}
+
+
+def segmenti_fase(run):
+    """Energia (Wh) per fase, nell'ordine in cui le fasi compaiono nel run"""
+    # factorize numera le fasi in ordine di prima apparizione, senza ordinare le stringhe
+    indici, nomi = pd.factorize(run['fasi'][:-1])
+    energie = np.bincount(indici, weights=energia_intervalli(run['t'], run['p']), minlength=len(nomi)) / 3600
+    return {str(nome): float(e) for nome, e in zip(nomi, energie) if nome}
+
+
+def riassumi_run(run, allineamento, n_segmenti):
+    riassunto = statistiche_run(run)
+    riassunto['path'] = run['path']
+    if allineamento == 'fase':
+        riassunto['segments'] = segmenti_fase(run)
+    else:
+        riassunto['segments'] = segmenti_progresso(run, n_segmenti)
+    return riassunto
+
+
+def _beta_incompleta(x, a, b):
+    """Funzione beta incompleta regolarizzata I_x(a, b) (frazione continua di Lentz)"""
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    if x > (a + 1) / (a + b + 2):
+        return 1.0 - _beta_incompleta(1 - x, b, a)
+
+    fronte = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                      + a * math.log(x) + b * math.log(1 - x)) / a
+    minimo = 1e-300
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > minimo else minimo)
+    f = d
+    for m in range(1, 300):
+        for numeratore in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                           -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1.0 + numeratore * d
+            d = 1.0 / (d if abs(d) > minimo else minimo)
+            c = 1.0 + numeratore / c
+            c = c if abs(c) > minimo else minimo
+            f *= c * d
+        if abs(c * d - 1.0) < 1e-12:
+            break
+    return fronte * f
+
+
+def test_welch(baseline, candidato):
+    """p-value unilaterale (candidato > baseline) del t-test di Welch sull'energia dei run.
+
+    Tiene conto della varianza tra run ripetuti, così un aumento dentro il rumore
+    non fa fallire il gate. Restituisce None se uno dei due gruppi ha un solo run.
+    """
+    if len(baseline) < 2 or len(candidato) < 2:
+        return None
+
+    b = np.asarray(baseline, dtype=np.float64)
+    c = np.asarray(candidato, dtype=np.float64)
+    differenza = c.mean() - b.mean()
+    vb, vc = b.var(ddof=1) / len(b), c.var(ddof=1) / len(c)
+    errore = math.sqrt(vb + vc)
+    if errore == 0:
+        return 0.0 if differenza > 0 else 1.0
+
+    t = differenza / errore
+    gradi = (vb + vc) ** 2 / (vb ** 2 / (len(b) - 1) + vc ** 2 / (len(c) - 1))
+    coda = 0.5 * _beta_incompleta(gradi / (gradi + t * t), gradi / 2, 0.5)
+    return coda if t > 0 else 1.0 - coda
+
+
+def media_gruppo(riassunti):
+    chiavi = ['energy_wh', 'mean_power_w', 'p95_power_w', 'duration_s']
+    medie = {c: float(np.mean([r[c] for r in riassunti])) for c in chiavi}
+    # Solo i segmenti presenti in tutti i run sono confrontabili
+    comuni = [s for s in riassunti[0]['segments'] if all(s in r['segments'] for r in riassunti)]
+    medie['segments'] = {s: float(np.mean([r['segments'][s] for r in riassunti])) for s in comuni}
+    return medie
+
+
+def variazione(base, nuovo):
+    if base == 0:
+        return float('inf') if nuovo > 0 else 0.0
+    return (nuovo - base) / base * 100
+
+
+def scegli_allineamento(richiesto, runs):
+    if richiesto != 'auto':
+        return richiesto
+    return 'fase' if all(r['fasi'] is not None for r in runs) else 'progresso'
+
+
+def carica_baseline_salvata(path):
+    """Carica una baseline salvata con --salva-baseline verificandone la struttura"""
+    with open(path) as f:
+        salvata = json.load(f)
+
+    if not isinstance(salvata, dict):
+        raise ValueError(f"{path}: baseline salvata non valida")
+    if salvata.get('alignment') not in ('fase', 'progresso'):
+        raise ValueError(f"{path}: allineamento della baseline non valido")
+    segmenti = salvata.get('segments')
+    if not isinstance(segmenti, int) or segmenti < 1:
+        raise ValueError(f"{path}: numero di segmenti della baseline non valido")
+    if not isinstance(salvata.get('power_column', COLONNA_DEFAULT), str):
+        raise ValueError(f"{path}: colonna di potenza della baseline non valida")
+
+    runs = salvata.get('runs')
+    chiavi = ('energy_wh', 'mean_power_w', 'p95_power_w', 'duration_s')
+    if not isinstance(runs, list) or not runs:
+        raise ValueError(f"{path}: la baseline salvata non contiene run")
+    for run in runs:
+        if (not isinstance(run, dict) or not isinstance(run.get('segments'), dict)
+                or not all(isinstance(run.get(c), (int, float)) for c in chiavi)):
+            raise ValueError(f"{path}: run della baseline salvata non valido")
+    return salvata
+
+
+def salva_baseline(path, riassunti, allineamento, n_segmenti, colonna):
+    with open(path, 'w') as f:
+        json.dump({
+            'alignment': allineamento,
+            'segments': n_segmenti,
+            'power_column': colonna,
+            'runs': riassunti
+        }, f, indent=2)
+
+
+def stampa_confronto(base, cand, allineamento):
+    print(f"\n--- Confronto ({allineamento}) ---")
+    print(f"{'Metrica':<16}{'Baseline':>14}{'Candidato':>14}{'Delta':>10}")
+    etichette = [
+        ('energy_wh', 'Energia (Wh)'),
+        ('mean_power_w', 'Potenza media'),
+        ('p95_power_w', 'Potenza p95'),
+        ('duration_s', 'Durata (s)')
+    ]
+    for chiave, etichetta in etichette:
+        print(f"{etichetta:<16}{base[chiave]:>14.4f}{cand[chiave]:>14.4f}"
+              f"{variazione(base[chiave], cand[chiave]):>+9.2f}%")
+
+    segmenti = [s for s in base['segments'] if s in cand['segments']]
+    if segmenti:
+        print(f"\n{'Segmento':<16}{'Baseline Wh':>14}{'Candidato Wh':>14}{'Delta':>10}")
+        for s in segmenti:
+            b, c = base['segments'][s], cand['segments'][s]
+            print(f"{s:<16}{b:>14.4f}{c:>14.4f}{variazione(b, c):>+9.2f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Confronta run del monitor e fallisce se il consumo energetico peggiora',
+        epilog='Con almeno 2 run per gruppo il gate fallisce solo se l\'aumento supera --soglia '
+               'ed è significativo (t-test di Welch). Con un solo run per gruppo il test non è '
+               'possibile e decide solo --soglia, a meno di --richiedi-ripetizioni.')
+    parser.add_argument('--baseline', nargs='+', required=True,
+                        help='CSV di riferimento, oppure un JSON salvato con --salva-baseline')
+    parser.add_argument('--candidato', nargs='+', required=True, help='CSV dei run da valutare')
+    parser.add_argument('--soglia', type=float, default=5.0,
+                        help='Aumento percentuale di energia oltre il quale il gate fallisce (default: 5)')
+    parser.add_argument('--richiedi-ripetizioni', action='store_true',
+                        help='Esce con errore se un gruppo ha meno di 2 run, invece di decidere sulla sola soglia')
+    parser.add_argument('--alpha', type=float, default=0.05,
+                        help='Livello di significatività del t-test di Welch (default: 0.05)')
+    parser.add_argument('--allineamento', choices=['auto', 'fase', 'progresso'], default='auto',
+                        help='Allinea per marcatori di fase o per avanzamento normalizzato (default: auto)')
+    parser.add_argument('--segmenti', type=int,
+                        help=f'Numero di segmenti per l\'allineamento a progresso (default: {SEGMENTI_DEFAULT})')
+    parser.add_argument('--colonna',
+                        help=f'Colonna di potenza da integrare (default: {COLONNA_DEFAULT})')
+    parser.add_argument('--salva-baseline', metavar='FILE', help='Salva i riassunti della baseline in JSON')
+    args = parser.parse_args(argv)
+
+    if args.segmenti is not None and args.segmenti < 1:
+        print("Errore: --segmenti deve essere almeno 1")
+        return EXIT_ERRORE
+
+    try:
+        salvata = None
+        if len(args.baseline) == 1 and args.baseline[0].endswith('.json'):
+            salvata = carica_baseline_salvata(args.baseline[0])
+            colonna_salvata = salvata.get('power_column', COLONNA_DEFAULT)
+            # Opzioni esplicite in conflitto con la baseline renderebbero il confronto incoerente
+            if args.colonna not in (None, colonna_salvata):
+                print(f"Errore: la baseline salvata integra la colonna '{colonna_salvata}'")
+                return EXIT_ERRORE
+            if (salvata['alignment'] == 'progresso'
+                    and args.segmenti not in (None, salvata['segments'])):
+                print(f"Errore: la baseline salvata usa {salvata['segments']} segmenti")
+                return EXIT_ERRORE
+            args.colonna = colonna_salvata
+            print(f"Baseline salvata: colonna '{colonna_salvata}', allineamento '{salvata['alignment']}'"
+                  f", {salvata['segments']} segmenti")
+        elif args.colonna is None:
+            args.colonna = COLONNA_DEFAULT
+
+        candidati = [carica_run(p, args.colonna) for p in args.candidato]
+
+        if salvata is not None:
+            allineamento = salvata['alignment']
+            n_segmenti = salvata['segments']
+            if args.allineamento not in ('auto', allineamento):
+                print(f"Errore: la baseline salvata usa l'allineamento '{allineamento}'")
+                return EXIT_ERRORE
+            if allineamento == 'fase' and any(r['fasi'] is None for r in candidati):
+                print("Errore: la baseline è allineata per fase ma i candidati non hanno marcatori di fase")
+                return EXIT_ERRORE
+            riassunti_base = salvata['runs']
+        else:
+            baseline = [carica_run(p, args.colonna) for p in args.baseline]
+            allineamento = scegli_allineamento(args.allineamento, baseline + candidati)
+            n_segmenti = args.segmenti if args.segmenti is not None else SEGMENTI_DEFAULT
+            if allineamento == 'fase' and any(r['fasi'] is None for r in baseline + candidati):
+                print("Errore: allineamento per fase richiesto ma alcuni run non hanno la colonna 'phase'")
+                return EXIT_ERRORE
+            riassunti_base = [riassumi_run(r, allineamento, n_segmenti) for r in baseline]
+
+        riassunti_cand = [riassumi_run(r, allineamento, n_segmenti) for r in candidati]
+
+        if args.salva_baseline:
+            salva_baseline(args.salva_baseline, riassunti_base, allineamento, n_segmenti, args.colonna)
+            print(f"Baseline salvata in: {args.salva_baseline}")
+
+        base = media_gruppo(riassunti_base)
+        cand = media_gruppo(riassunti_cand)
+        stampa_confronto(base, cand, allineamento)
+
+        delta = variazione(base['energy_wh'], cand['energy_wh'])
+        p_value = test_welch([r['energy_wh'] for r in riassunti_base],
+                             [r['energy_wh'] for r in riassunti_cand])
+    except Exception as e:
+        # Qualsiasi errore sugli input esce con EXIT_ERRORE, mai con EXIT_REGRESSIONE
+        print(f"Errore: {type(e).__name__}: {e}")
+        return EXIT_ERRORE
+
+    print(f"\nRun: baseline={len(riassunti_base)}, candidato={len(riassunti_cand)}")
+    if p_value is None:
+        if args.richiedi_ripetizioni:
+            print("Errore: --richiedi-ripetizioni richiede almeno 2 run per gruppo")
+            return EXIT_ERRORE
+        print("Test di significatività non eseguito: servono almeno 2 run per gruppo, decide solo la soglia")
+    else:
+        print(f"p-value (Welch, unilaterale): {p_value:.4f}")
+
+    # Con run ripetuti il gate fallisce solo se l'aumento supera la soglia ed è
+    # distinguibile dal rumore; con un solo run per gruppo decide la soglia
+    regressione = delta > args.soglia and (p_value is None or p_value < args.alpha)
+    if regressione:
+        print(f"REGRESSIONE: energia +{delta:.2f}% (soglia {args.soglia:.2f}%)")
+        return EXIT_REGRESSIONE
+
+    print(f"OK: variazione energia {delta:+.2f}% (soglia {args.soglia:.2f}%)")
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,9 @@ import threading
 from datetime import datetime
 import os
 import signal
+import tempfile
+import shutil
+from collections import deque
 
 # Configurazione delle dipendenze opzionali
 try:
@@ -26,14 +29,143 @@ except ImportError:
 if CODECARBON_AVAILABLE:
     logger.setLevel("ERROR")
 
+class ConsoleRenderer:
+    """Disegna lo stato del monitor da un thread separato, a frequenza fissa.
+
+    Legge solo l'ultimo stato aggregato del monitor, così le scritture sul
+    terminale (lente su SSH) non rallentano il campionamento.
+    """
+    SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+    def __init__(self, monitor, refresh_rate=2, tui=False, stream=None):
+        self.monitor = monitor
+        self.refresh_interval = 1.0 / refresh_rate
+        self.tui = tui
+        self.stream = stream if stream is not None else sys.stdout
+        # Niente ritorni a capo e sequenze ANSI nei log non interattivi
+        self.enabled = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.lines_drawn = 0
+
+    def start(self):
+        if not self.enabled:
+            print("Output non interattivo: statistiche live disabilitate")
+            return
+        self.thread = threading.Thread(target=self.render_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join(timeout=2)
+        self.thread = None
+        # Ultimo aggiornamento con lo stato finale
+        self.render()
+        if self.lines_drawn:
+            self.stream.write("\n")
+            self.stream.flush()
+        self.lines_drawn = 0
+
+    def render_loop(self):
+        while not self.stop_event.wait(self.refresh_interval):
+            try:
+                self.render()
+            except Exception as e:
+                self.stream.write(f"\nErrore visualizzazione: {type(e).__name__}: {e}\n")
+                self.lines_drawn = 0
+
+    def render(self):
+        state = self.monitor.get_state()
+        if state is None:
+            return
+
+        # Righe più larghe del terminale andrebbero a capo e il cursore non
+        # tornerebbe più all'inizio del blocco: si tagliano alla larghezza
+        width = max(1, shutil.get_terminal_size().columns - 1)
+        if self.tui:
+            lines = self.format_tui(state, width)
+        else:
+            lines = [self.monitor.format_stats(state['row'])]
+        lines = [line[:width] for line in lines]
+
+        # Riporta il cursore all'inizio del blocco disegnato in precedenza
+        output = "\r"
+        if self.lines_drawn > 1:
+            output += f"\x1b[{self.lines_drawn - 1}A"
+        output += "\n".join(line + "\x1b[K" for line in lines)
+        # Se il blocco si è accorciato, pulisce le righe rimaste sotto
+        extra = self.lines_drawn - len(lines)
+        if extra > 0:
+            output += "\n\x1b[K" * extra + f"\x1b[{extra}A"
+
+        self.stream.write(output)
+        self.stream.flush()
+        self.lines_drawn = len(lines)
+
+    def sparkline(self, values, max_value=None):
+        if not values:
+            return ""
+        top = max_value if isinstance(max_value, (int, float)) and max_value > 0 else max(values)
+        if top <= 0:
+            return self.SPARK_CHARS[0] * len(values)
+        last = len(self.SPARK_CHARS) - 1
+        return "".join(self.SPARK_CHARS[min(last, max(0, int(v / top * last)))] for v in values)
+
+    def format_tui(self, state, width=80):
+        row = state['row']
+        lines = [f"T: {row[1]:.1f}s | CPU: {row[2]:.1f}% | RAM: {row[3]:.1f} GB | Campioni: {state['samples']}"]
+
+        for gpu in state['gpus']:
+            line = f"GPU {gpu['index']} {gpu.get('name', 'N/A')[:16]:<16}"
+            if gpu.get('utilization') is not None:
+                line += f" | {gpu['utilization']:5.1f}%"
+            if gpu.get('memory_percent') is not None:
+                line += f" | VRAM {gpu['memory_percent']:5.1f}%"
+            if gpu.get('temperature') is not None:
+                line += f" | {gpu['temperature']:.0f}°C"
+            if gpu.get('power_watts') is not None:
+                line += f" | {gpu['power_watts']:6.1f}W"
+            # La sparkline usa solo lo spazio rimasto sulla riga
+            history = state['power_history'].get(gpu['index'], [])[-max(0, width - len(line) - 1):]
+            if history and width - len(line) > 1:
+                line += f" {self.sparkline(history, gpu.get('power_limit'))}"
+            lines.append(line)
+
+        if not state['gpus']:
+            lines.append("Nessuna GPU NVIDIA disponibile")
+
+        energy_line = f"Energia GPU: {state['energy_wh']:.4f} Wh"
+        if CODECARBON_AVAILABLE and len(row) > 13:
+            energy_line += f" | CC Energy: {(row[11] or 0)*1000:.4f}Wh"
+            energy_line += f" | CC CO2: {(row[12] or 0)*1000:.4f}g"
+        lines.append(energy_line)
+
+        return [line[:width] for line in lines]
+
+
 class GPUEnergyMonitor:
-    def __init__(self, sampling_rate=2, output_file=None, country_code="ITA"):
+    def __init__(self, sampling_rate=2, output_file=None, country_code="ITA",
+                 refresh_rate=2, tui=False):
         self.sampling_rate = sampling_rate
         self.sampling_interval = 1.0 / sampling_rate
         self.monitoring = False
         self.data = []
         self.country_code = country_code
         
+        # Stato aggregato letto dal renderer (aggiornato dal thread di campionamento)
+        self.tui = tui
+        self.renderer = ConsoleRenderer(self, refresh_rate=refresh_rate, tui=tui)
+        self.state_lock = threading.Lock()
+        self.latest_row = None
+        self.latest_gpus = []
+        self.power_history = {}
+        self.energy_wh = 0.0
+        self.last_power_sample = None
+        self.samples_collected = 0
+        
         # File di output
         if output_file is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -46,6 +178,7 @@ class GPUEnergyMonitor:
         self.target_pid = None
         self.monitor_thread = None
         self.start_time = None
+        self.phase_file = None
         
         # Inizializza NVIDIA
         self.gpu_info = self.initialize_nvidia()
@@ -74,7 +207,8 @@ class GPUEnergyMonitor:
             'gpu_power_limit',
             'codecarbon_energy_kwh',
             'codecarbon_emissions_kg_co2',
-            'codecarbon_power_watts'
+            'codecarbon_power_watts',
+            'phase'
         ]
 
     def initialize_nvidia(self):
@@ -203,6 +337,16 @@ class GPUEnergyMonitor:
         except:
             return None, None
 
+    def get_phase(self):
+        """Legge il marcatore di fase scritto dal processo target in MONITOR_PHASE_FILE"""
+        if not self.phase_file:
+            return None
+        try:
+            with open(self.phase_file) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
     def get_codecarbon_metrics(self):
         """Ottiene metriche da CodeCarbon"""
         if not self.tracker or not self.codecarbon_started:
@@ -261,8 +405,10 @@ class GPUEnergyMonitor:
         cpu_percent = psutil.cpu_percent()
         memory_used_gb = psutil.virtual_memory().used / (1024**3)
         
-        # Dati GPU
-        gpu_stats = self.get_gpu_stats(0)
+        # Dati GPU (tutte le GPU solo per la TUI, il CSV registra la GPU 0)
+        gpu_count = len(self.gpu_info['gpus']) if self.tui else min(1, len(self.gpu_info['gpus']))
+        gpu_stats_list = [self.get_gpu_stats(i) for i in range(gpu_count)]
+        gpu_stats = gpu_stats_list[0] if gpu_stats_list else {}
         
         # Dati processo
         process_cpu, process_mem = self.get_process_stats()
@@ -296,8 +442,53 @@ class GPUEnergyMonitor:
            
             row_data.extend([None] * 3)
         
+        row_data.append(self.get_phase())
+        
+        self.update_state(row_data, gpu_stats_list)
+        
         return row_data
 
+    def update_state(self, data_row, gpu_stats_list):
+        """Aggiorna lo stato aggregato: ultimo campione, storico potenza ed energia GPU"""
+        elapsed = data_row[1]
+        gpus = []
+        total_power = None
+        for i, stats in enumerate(gpu_stats_list):
+            if not stats:
+                continue
+            gpus.append(dict(stats, index=i))
+            if stats.get('power_watts') is not None:
+                total_power = (total_power or 0) + stats['power_watts']
+        
+        with self.state_lock:
+            self.latest_row = data_row
+            self.latest_gpus = gpus
+            self.samples_collected += 1
+            for gpu in gpus:
+                if gpu.get('power_watts') is not None:
+                    history = self.power_history.setdefault(gpu['index'], deque(maxlen=40))
+                    history.append(gpu['power_watts'])
+            
+            # Integrazione della potenza GPU totale (regola dei trapezi)
+            if total_power is not None:
+                if self.last_power_sample is not None:
+                    last_time, last_power = self.last_power_sample
+                    self.energy_wh += (total_power + last_power) / 2 * (elapsed - last_time) / 3600
+                self.last_power_sample = (elapsed, total_power)
+
+    def get_state(self):
+        """Copia dello stato aggregato per il renderer, None prima del primo campione"""
+        with self.state_lock:
+            if self.latest_row is None:
+                return None
+            return {
+                'row': self.latest_row,
+                'gpus': [dict(gpu) for gpu in self.latest_gpus],
+                'power_history': {i: list(h) for i, h in self.power_history.items()},
+                'energy_wh': self.energy_wh,
+                'samples': self.samples_collected
+            }
+
     def monitor_loop(self):
         """Loop principale di monitoraggio"""
         print(f"Avvio monitoraggio con frequenza {self.sampling_rate} Hz")
@@ -319,9 +510,6 @@ class GPUEnergyMonitor:
                     writer = csv.writer(csvfile)
                     writer.writerow(data_row)
                 
-                # Stampa statistiche
-                self.print_stats(data_row)
-                
                 self.data.append(data_row)
                 
                 time.sleep(self.sampling_interval)
@@ -332,8 +520,8 @@ class GPUEnergyMonitor:
                 print(f"Errore monitoraggio: {type(e).__name__}: {e}")
                 time.sleep(self.sampling_interval)
 
-    def print_stats(self, data_row):
-        """Stampa una sintesi delle statistiche"""
+    def format_stats(self, data_row):
+        """Formatta una sintesi delle statistiche su una riga"""
         elapsed = data_row[1]
         cpu_percent = data_row[2]
         gpu_util = data_row[5]
@@ -362,7 +550,7 @@ class GPUEnergyMonitor:
             stats_line += f" | CC CO2: {cc_emissions*1000:.4f}g"
             stats_line += f" | CC Power: {cc_power:.1f}W"
         
-        print(f"\r{stats_line}", end="", flush=True)
+        return stats_line
 
     def start_monitoring(self, target_command):
         """Avvia il monitoraggio e il processo target"""
@@ -403,42 +591,59 @@ class GPUEnergyMonitor:
             self.last_cc_time = time.time()
             self.last_cc_energy = 0
         
-        # Avvia il processo target
-        print(f"Avvio processo: {' '.join(target_command)}")
-        self.target_process = subprocess.Popen(
-            target_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        self.target_pid = self.target_process.pid
-        print(f"Processo avviato con PID: {self.target_pid}")
-        
-        # Avvia monitoraggio
-        self.monitoring = True
-        self.monitor_thread = threading.Thread(target=self.monitor_loop)
-        self.monitor_thread.daemon = True
-        self.monitor_thread.start()
-        
-        # Aspetta che il processo finisca
+        # File per i marcatori di fase (vedi segna_fase in test_load.py)
+        fd, self.phase_file = tempfile.mkstemp(prefix="monitor_phase_", suffix=".txt")
+        os.close(fd)
+        
+        # Lo stop del renderer e la pulizia del file di fase avvengono anche
+        # se l'attesa viene interrotta (es. sys.exit dal gestore di SIGINT)
         try:
-            stdout, stderr = self.target_process.communicate()
+            # Avvia il processo target
+            print(f"Avvio processo: {' '.join(target_command)}")
+            self.target_process = subprocess.Popen(
+                target_command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                env=dict(os.environ, MONITOR_PHASE_FILE=self.phase_file)
+            )
+            self.target_pid = self.target_process.pid
+            print(f"Processo avviato con PID: {self.target_pid}")
+            
+            # Avvia monitoraggio
+            self.monitoring = True
+            self.monitor_thread = threading.Thread(target=self.monitor_loop)
+            self.monitor_thread.daemon = True
+            self.monitor_thread.start()
+            self.renderer.start()
             
-            # Mostra output
-            if stdout:
-                print(f"\n--- Output del processo ---\n{stdout}")
-            if stderr:
-                print(f"\n--- Errori del processo ---\n{stderr}")
+            # Aspetta che il processo finisca
+            try:
+                stdout, stderr = self.target_process.communicate()
+                self.renderer.stop()
                 
-        except KeyboardInterrupt:
-            print(f"\nInterruzione rilevata, terminando processo...")
-            self.target_process.terminate()
-            self.target_process.wait()
-        
-        # Ferma monitoraggio
-        self.monitoring = False
-        if self.monitor_thread.is_alive():
-            self.monitor_thread.join(timeout=2)
+                # Mostra output
+                if stdout:
+                    print(f"\n--- Output del processo ---\n{stdout}")
+                if stderr:
+                    print(f"\n--- Errori del processo ---\n{stderr}")
+                    
+            except KeyboardInterrupt:
+                print(f"\nInterruzione rilevata, terminando processo...")
+                self.target_process.terminate()
+                self.target_process.wait()
+        finally:
+            # Ferma monitoraggio
+            self.renderer.stop()
+            self.monitoring = False
+            if self.monitor_thread and self.monitor_thread.is_alive():
+                self.monitor_thread.join(timeout=2)
+            
+            try:
+                os.remove(self.phase_file)
+            except OSError:
+                pass
+            self.phase_file = None
         
         # Ferma CodeCarbon e ottenimento risultati finali
         if CODECARBON_AVAILABLE and self.codecarbon_started:
@@ -521,44 +726,82 @@ class GPUEnergyMonitor:
         elif CODECARBON_AVAILABLE:
             print("\nAttenzione: Dati CodeCarbon incompleti. Verifica la connessione internet e la configurazione della regione.")
 
-def main():
-    if len(sys.argv) < 2:
-        print("Utilizzo: python3 gpu_monitor.py [-f FREQ] [-c COUNTRY] nome_programma.py [args...]")
-        print("Esempio: python3 gpu_monitor.py -f 5 -c ITA script.py")
-        sys.exit(1)
-    
+def parse_arguments(argv):
+    """Legge le opzioni del monitor fino al primo argomento che non lo è (lo script).
+
+    Tutto ciò che segue lo script viene passato al processo target senza modifiche.
+    """
     # Parametri configurabili
     sampling_rate = 2  # Default 2Hz
-    target_start = 1
     country_code = "ITA"  # Default country
+    refresh_rate = 2  # Aggiornamenti del terminale al secondo
+    tui = False
     
     # Parse arguments
-    i = 1
-    while i < len(sys.argv):
-        if sys.argv[i] == '-f':
+    i = 0
+    while i < len(argv):
+        if argv[i] == '-f':
             try:
-                sampling_rate = float(sys.argv[i+1])
-                target_start = i+2
+                sampling_rate = float(argv[i+1])
                 i += 2
                 print(f"Frequenza impostata a: {sampling_rate} Hz")
                 continue
             except:
                 print("Errore: frequenza non valida")
                 sys.exit(1)
-        elif sys.argv[i] == '-c':
+        elif argv[i] == '-c':
             try:
-                country_code = sys.argv[i+1]
-                target_start = i+2
+                country_code = argv[i+1]
                 i += 2
                 print(f"Codice paese impostato a: {country_code}")
                 continue
             except:
                 print("Errore: codice paese non valido")
                 sys.exit(1)
-        i += 1
+        elif argv[i] == '-r':
+            try:
+                refresh_rate = float(argv[i+1])
+                if refresh_rate <= 0:
+                    raise ValueError
+                i += 2
+                print(f"Aggiornamento terminale a: {refresh_rate} Hz")
+                continue
+            except:
+                print("Errore: frequenza di aggiornamento non valida")
+                sys.exit(1)
+        elif argv[i] == '--tui':
+            tui = True
+            i += 1
+            continue
+        break
+    
+    if i >= len(argv):
+        print("Errore: nessuno script da monitorare")
+        sys.exit(1)
     
     # Comando target
-    target_command = ['python3'] + sys.argv[target_start:]
+    target_command = ['python3'] + argv[i:]
+    
+    return {
+        'sampling_rate': sampling_rate,
+        'country_code': country_code,
+        'refresh_rate': refresh_rate,
+        'tui': tui
+    }, target_command
+
+def main():
+    if len(sys.argv) < 2:
+        print("Utilizzo: python3 gpu_monitor.py [-f FREQ] [-c COUNTRY] [-r REFRESH] [--tui] nome_programma.py [args...]")
+        print("          python3 gpu_monitor.py compare --baseline RUN.csv... --candidato RUN.csv...")
+        print("Esempio: python3 gpu_monitor.py -f 5 -c ITA script.py")
+        sys.exit(1)
+    
+    # Confronto tra run già registrati (gate di regressione energetica)
+    if sys.argv[1] == 'compare':
+        from compare_runs import main as compare_main
+        sys.exit(compare_main(sys.argv[2:]))
+    
+    options, target_command = parse_arguments(sys.argv[1:])
     
     # Verifica NVIDIA
     if not NVIDIA_AVAILABLE:
@@ -573,7 +816,7 @@ def main():
         print("Dati di emissione non saranno disponibili...\n")
     
     # Crea e avvia monitor
-    monitor = GPUEnergyMonitor(sampling_rate=sampling_rate, country_code=country_code)
+    monitor = GPUEnergyMonitor(**options)
     
     # Gestore segnali
     def signal_handler(signum, frame):
@@ -0,0 +1,93 @@
+import pytest
+
+import compare_runs
+from test_load import genera_run_sintetico
+
+
+def genera_runs(cartella, prefisso, seeds, scala_potenza=1.0):
+    percorsi = []
+    for seed in seeds:
+        percorso = str(cartella / f"{prefisso}{seed}.csv")
+        genera_run_sintetico(percorso, cicli=3, gpu=True, seed=seed, scala_potenza=scala_potenza)
+        percorsi.append(percorso)
+    return percorsi
+
+
+def test_regressione_rilevata(tmp_path):
+    baseline = genera_runs(tmp_path, 'base', [1, 2, 3])
+    candidato = genera_runs(tmp_path, 'cand', [11, 12, 13], scala_potenza=1.1)
+    argv = ['--baseline', *baseline, '--candidato', *candidato]
+    assert compare_runs.main(argv) == compare_runs.EXIT_REGRESSIONE
+
+
+def test_stessa_scala_ok(tmp_path):
+    baseline = genera_runs(tmp_path, 'base', [1, 2, 3])
+    candidato = genera_runs(tmp_path, 'cand', [21, 22, 23])
+    argv = ['--baseline', *baseline, '--candidato', *candidato]
+    assert compare_runs.main(argv) == compare_runs.EXIT_OK
+
+
+@pytest.mark.parametrize("t, gradi, coda", [
+    (2.0, 10, 0.0367),
+    (2.228, 10, 0.025),
+    (1.0, 1, 0.25),
+    (2.086, 20, 0.025),
+])
+def test_coda_t_di_student(t, gradi, coda):
+    # Stessa formula di test_welch: coda superiore della t di Student
+    valore = 0.5 * compare_runs._beta_incompleta(gradi / (gradi + t * t), gradi / 2, 0.5)
+    assert valore == pytest.approx(coda, abs=5e-4)
+
+
+def test_welch_coda_nota():
+    # Gruppi da 6 con varianza uguale: t = 2.0 con 10 gradi di libertà
+    baseline = [-1.0, 1.0, -1.0, 1.0, -1.0, 1.0]
+    scarto = 2.0 * (2 * 1.2 / 6) ** 0.5
+    candidato = [v + scarto for v in baseline]
+    assert compare_runs.test_welch(baseline, candidato) == pytest.approx(0.0367, abs=5e-4)
+    assert compare_runs.test_welch(candidato, baseline) == pytest.approx(1 - 0.0367, abs=5e-4)
+    assert compare_runs.test_welch([1.0], candidato) is None
+
+
+def test_segmenti_fase_sommano_energia(tmp_path):
+    percorso = genera_runs(tmp_path, 'base', [1])[0]
+    run = compare_runs.carica_run(percorso)
+    segmenti = compare_runs.segmenti_fase(run)
+    assert list(segmenti)[0] == 'gpu_iniziale'
+    assert sum(segmenti.values()) == pytest.approx(compare_runs.statistiche_run(run)['energy_wh'])
+
+
+@pytest.mark.parametrize("contenuto", [
+    '{"alignment": "fase", "segments": 10, "runs": []}',
+    '[]',
+    '{"alignment": "fase", "segments": 10, "runs": [{"energy_wh": 1.0}]}',
+])
+def test_baseline_salvata_non_valida(tmp_path, contenuto):
+    candidato = genera_runs(tmp_path, 'cand', [1])
+    salvata = tmp_path / 'baseline.json'
+    salvata.write_text(contenuto)
+    argv = ['--baseline', str(salvata), '--candidato', *candidato]
+    assert compare_runs.main(argv) == compare_runs.EXIT_ERRORE
+
+
+@pytest.mark.parametrize("opzioni, atteso", [
+    (['--colonna', 'codecarbon_power_watts'], compare_runs.EXIT_ERRORE),
+    (['--segmenti', '5'], compare_runs.EXIT_ERRORE),
+    (['--colonna', 'gpu_power_watts', '--segmenti', '4'], compare_runs.EXIT_OK),
+])
+def test_opzioni_in_conflitto_con_baseline_salvata(tmp_path, opzioni, atteso):
+    baseline = genera_runs(tmp_path, 'base', [1, 2])
+    candidato = genera_runs(tmp_path, 'cand', [21, 22])
+    salvata = str(tmp_path / 'baseline.json')
+    argv = ['--baseline', *baseline, '--candidato', *candidato, '--allineamento', 'progresso',
+            '--segmenti', '4', '--salva-baseline', salvata]
+    assert compare_runs.main(argv) == compare_runs.EXIT_OK
+    assert compare_runs.main(['--baseline', salvata, '--candidato', *candidato, *opzioni]) == atteso
+
+
+def test_run_singolo_decide_la_soglia(tmp_path):
+    baseline = genera_runs(tmp_path, 'base', [1])
+    candidato = genera_runs(tmp_path, 'cand', [11], scala_potenza=1.1)
+    argv = ['--baseline', *baseline, '--candidato', *candidato]
+    assert compare_runs.main(argv) == compare_runs.EXIT_REGRESSIONE
+    assert compare_runs.main([*argv, '--richiedi-ripetizioni']) == compare_runs.EXIT_ERRORE
@@ -1,6 +1,9 @@
+import os
+import csv
 import time
 import math
 import argparse
+from datetime import datetime, timedelta
 import numpy as np
 import threading
 
@@ -39,19 +42,109 @@ def gpu_load(duration, intensity):
             np.dot(a, b)
             time.sleep(0.1)
 
+def segna_fase(nome):
+    """Comunica al monitor la fase corrente tramite MONITOR_PHASE_FILE"""
+    percorso = os.environ.get('MONITOR_PHASE_FILE')
+    if not percorso:
+        return
+    # Scrittura su file temporaneo e os.replace: il monitor non legge mai un file troncato
+    temporaneo = f"{percorso}.{os.getpid()}.tmp"
+    try:
+        with open(temporaneo, 'w') as f:
+            f.write(nome)
+        os.replace(temporaneo, percorso)
+    except OSError:
+        try:
+            os.remove(temporaneo)
+        except OSError:
+            pass
+
+def fasi_test(cicli, gpu):
+    """Sequenza delle fasi del test: (nome, durata, intensità CPU, intensità GPU)"""
+    fasi = []
+    if gpu:
+        fasi.append(('gpu_iniziale', 5, 0.0, 1.0))
+        fasi.append(('pausa_iniziale', 1, 0.0, 0.0))
+    for i in range(cicli):
+        intensity = (i + 1) / cicli
+        fasi.append((f'ciclo{i+1}_cpu', 5, intensity, 0.0))
+        if gpu:
+            fasi.append((f'ciclo{i+1}_gpu', 5, 0.0, intensity))
+        fasi.append((f'ciclo{i+1}_idle', 2, 0.0, 0.0))
+    return fasi
+
+def genera_run_sintetico(output_file, cicli=5, gpu=True, seed=0, frequenza=10,
+                         scala_potenza=1.0, rumore_watt=5.0, rumore_run=0.01):
+    """Scrive un CSV nel formato di monitor_codecarbon.py simulando il profilo del test.
+
+    Il risultato dipende solo dai parametri (seed incluso): serve come fixture
+    deterministica per compare_runs.py senza hardware reale.
+    """
+    rng = np.random.default_rng(seed)
+    fasi = fasi_test(cicli, gpu)
+
+    durate = np.array([f[1] for f in fasi], dtype=float)
+    campioni = np.maximum(1, np.round(durate * frequenza).astype(int))
+    nomi = np.repeat(np.array([f[0] for f in fasi]), campioni)
+    cpu_int = np.repeat(np.array([f[2] for f in fasi]), campioni)
+    gpu_int = np.repeat(np.array([f[3] for f in fasi]), campioni)
+
+    n = len(nomi)
+    elapsed = np.arange(n) / frequenza
+    # Modello di potenza: idle + carico GPU + contributo CPU, con rumore per campione e per run
+    fattore_run = scala_potenza * rng.normal(1.0, rumore_run)
+    potenza = (30.0 + 220.0 * gpu_int + 20.0 * cpu_int) * fattore_run
+    potenza = np.maximum(0.0, potenza + rng.normal(0.0, rumore_watt, n))
+    utilizzo = np.clip(100.0 * gpu_int + rng.normal(0.0, 2.0, n), 0.0, 100.0)
+    cpu_percent = np.clip(100.0 * cpu_int + rng.normal(5.0, 2.0, n), 0.0, 100.0)
+
+    inizio = datetime(2025, 1, 1)
+    with open(output_file, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow([
+            'timestamp', 'elapsed_time', 'cpu_percent', 'memory_used_gb',
+            'gpu_name', 'gpu_utilization', 'gpu_memory_used_mb', 'gpu_memory_percent',
+            'gpu_temperature', 'gpu_power_watts', 'gpu_power_limit',
+            'codecarbon_energy_kwh', 'codecarbon_emissions_kg_co2', 'codecarbon_power_watts',
+            'phase'
+        ])
+        for k in range(n):
+            writer.writerow([
+                (inizio + timedelta(seconds=float(elapsed[k]))).isoformat(),
+                f"{elapsed[k]:.4f}", f"{cpu_percent[k]:.1f}", 8.0,
+                'Synthetic GPU', f"{utilizzo[k]:.1f}", 1024, 10.0,
+                60, f"{potenza[k]:.2f}", 300,
+                None, None, None,
+                nomi[k]
+            ])
+
+    return n
+
 def main():
     parser = argparse.ArgumentParser(description='Generatore di carico CPU/GPU')
     parser.add_argument('cicli', type=int, nargs='?', default=5, help='Numero di cicli di carico')
     parser.add_argument('--gpu', action='store_true', help='Abilita carico GPU')
+    parser.add_argument('--sintetico', metavar='FILE', help='Genera un CSV sintetico del monitor invece di eseguire il carico')
+    parser.add_argument('--seed', type=int, default=0, help='Seed del run sintetico')
+    parser.add_argument('--frequenza', type=float, default=10, help='Campioni al secondo del run sintetico')
+    parser.add_argument('--scala-potenza', type=float, default=1.0, help='Fattore moltiplicativo della potenza sintetica')
     args = parser.parse_args()
 
+    if args.sintetico:
+        n = genera_run_sintetico(args.sintetico, cicli=args.cicli, gpu=args.gpu, seed=args.seed,
+                                 frequenza=args.frequenza, scala_potenza=args.scala_potenza)
+        print(f"Run sintetico salvato in {args.sintetico} ({n} campioni)")
+        return
+
     print(f"Avvio test con {args.cicli} cicli {'(CPU+GPU)' if args.gpu else '(solo CPU)'}")
     
     # Fase iniziale: stress GPU al 100% per 5 secondi (solo se abilitata la GPU)
     if args.gpu:
         print("\n--- FASE INIZIALE: STRESS GPU AL 100% PER 5 SECONDI ---")
+        segna_fase('gpu_iniziale')
         gpu_load(5, 1.0)
         print("--- FASE INIZIALE COMPLETATA ---\n")
+        segna_fase('pausa_iniziale')
         time.sleep(1) 
     
     for i in range(args.cicli):
@@ -60,17 +153,21 @@ def main():
         
         # Fase CPU
         print(f"\nCiclo {i+1}/{args.cicli} - Carico CPU ({intensity*100:.0f}%)")
+        segna_fase(f'ciclo{i+1}_cpu')
         cpu_load(5, intensity)
         
         # Fase GPU (se richiesto)
         if args.gpu:
             print(f"Ciclo {i+1}/{args.cicli} - Carico GPU ({intensity*100:.0f}%)")
+            segna_fase(f'ciclo{i+1}_gpu')
             gpu_load(5, intensity)
         
         # Fase idle
         print(f"Ciclo {i+1}/{args.cicli} - Idle")
+        segna_fase(f'ciclo{i+1}_idle')
         time.sleep(2)
     
+    segna_fase('')
     print("\nTest completato")
 
 if __name__ == "__main__":
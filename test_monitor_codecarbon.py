@@ -0,0 +1,87 @@
+import io
+import os
+import re
+
+import pytest
+
+import monitor_codecarbon
+
+
+def test_argomenti_dello_script_passati_invariati():
+    options, target_command = monitor_codecarbon.parse_arguments(['script.py', '-r', '3', '--tui'])
+    assert target_command == ['python3', 'script.py', '-r', '3', '--tui']
+    assert options['refresh_rate'] == 2
+    assert options['tui'] is False
+
+
+def test_opzioni_del_monitor_prima_dello_script():
+    options, target_command = monitor_codecarbon.parse_arguments(
+        ['-f', '5', '-r', '4', '--tui', 'script.py', '-f', '1'])
+    assert target_command == ['python3', 'script.py', '-f', '1']
+    assert options == {'sampling_rate': 5.0, 'country_code': 'ITA', 'refresh_rate': 4.0, 'tui': True}
+
+
+def test_script_mancante():
+    with pytest.raises(SystemExit):
+        monitor_codecarbon.parse_arguments(['--tui'])
+
+
+class FakeTty(io.StringIO):
+    def isatty(self):
+        return True
+
+
+@pytest.fixture
+def monitor(tmp_path):
+    return monitor_codecarbon.GPUEnergyMonitor(output_file=str(tmp_path / 'run.csv'), tui=True)
+
+
+def riga(elapsed, power):
+    return ['ts', elapsed, 10.0, 4.0, 'GPU', 50, 1024, 20.0, 60, power, 300, None, None, None, None]
+
+
+def gpu(name, power):
+    return {'name': name, 'utilization': 50, 'memory_percent': 20.0, 'temperature': 60,
+            'power_watts': power, 'power_limit': 300}
+
+
+def test_renderer_disattivato_senza_tty(monitor):
+    stream = io.StringIO()
+    renderer = monitor_codecarbon.ConsoleRenderer(monitor, stream=stream)
+    monitor.update_state(riga(0.0, 100), [gpu('A', 100)])
+    renderer.start()
+    renderer.stop()
+    assert renderer.enabled is False
+    assert renderer.thread is None
+    assert '\r' not in stream.getvalue()
+
+
+@pytest.mark.parametrize("width", [40, 80, 200])
+def test_righe_tui_entro_la_larghezza(monitor, monkeypatch, width):
+    for k in range(50):
+        monitor.update_state(riga(k * 0.5, 250), [gpu('NVIDIA GeForce RTX 4090 Laptop GPU', 250),
+                                                  gpu('NVIDIA A100-SXM4-80GB', 120)])
+    state = monitor.get_state()
+    assert all(len(line) <= width for line in monitor.renderer.format_tui(state, width))
+
+    monkeypatch.setattr(monitor_codecarbon.shutil, 'get_terminal_size',
+                        lambda *args: os.terminal_size((width, 24)))
+    stream = FakeTty()
+    renderer = monitor_codecarbon.ConsoleRenderer(monitor, tui=True, stream=stream)
+    renderer.render()
+    righe = re.sub(r'\x1b\[\d*[AK]|\r', '', stream.getvalue()).split('\n')
+    assert len(righe) == 4
+    assert all(len(line) < width for line in righe)
+
+
+def test_energia_integrata_con_i_trapezi(monitor):
+    # Due GPU: potenza totale 200, 400, None (saltato), 200 W
+    monitor.update_state(riga(0.0, 100), [gpu('A', 100), gpu('B', 100)])
+    monitor.update_state(riga(1.0, 200), [gpu('A', 200), gpu('B', 200)])
+    monitor.update_state(riga(2.0, None), [gpu('A', None), gpu('B', None)])
+    monitor.update_state(riga(3.0, 100), [gpu('A', 100), gpu('B', 100)])
+    # (200+400)/2 * 1s + (400+200)/2 * 2s = 900 J
+    state = monitor.get_state()
+    assert state['energy_wh'] == pytest.approx(900 / 3600)
+    assert state['samples'] == 4
+    assert state['power_history'][0] == [100, 200, 100]